@@ -0,0 +1,21 @@
+"""
+Shared .env loader for the local development server and test scripts
+"""
+import os
+import re
+from pathlib import Path
+
+ENV_PATH = Path(__file__).parent / ".env"
+
+# KEY=value lines in one pass - blank lines and '#' comments never match
+_ENV_LINE_RE = re.compile(r'^[ \t]*([^#=\s][^=\n]*)=(.*)$', re.MULTILINE)
+
+def load_env(path=ENV_PATH):
+    """Copy KEY=value pairs from a .env file into os.environ; returns False if the file is missing"""
+    try:
+        text = Path(path).read_text()
+    except FileNotFoundError:
+        return False
+    for key, value in _ENV_LINE_RE.findall(text):
+        os.environ[key.strip()] = value.strip()
+    return True
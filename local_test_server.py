@@ -6,30 +6,26 @@ Serves index.html and routes /api/menu to the Menu handler
 import os
 import sys
 from pathlib import Path
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import json
 from datetime import datetime
+from dev_env import load_env
 
-# Load environment variables from .env file
-def load_env():
-    env_path = Path(__file__).parent / ".env"
-    if env_path.exists():
-        with open(env_path) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
-        print(f"✓ Loaded .env file")
-    else:
-        print("⚠️  .env file not found - API key may not be available")
+# Load environment variables from .env file - must run before importing menu, which reads GEMINI_API_KEY at import
+if load_env():
+    print("✓ Loaded .env file")
+else:
+    print("⚠️  .env file not found - API key may not be available")
+
+# Show the handler's per-step debug logging during local development
+os.environ.setdefault('LOG_LEVEL', 'DEBUG')
 
 # Add api directory to path
 sys.path.insert(0, str(Path(__file__).parent / "api"))
 from menu import handler as MenuHandler
 
-class LocalDevHandler(SimpleHTTPRequestHandler):
-    """Custom handler that routes API calls and serves static files"""
+class LocalDevHandler(MenuHandler, SimpleHTTPRequestHandler):
+    """Serves static files and handles /api/menu directly via the inherited Menu handler"""
 
     def do_GET(self):
         # Serve index.html for root path
@@ -50,12 +46,7 @@ class LocalDevHandler(SimpleHTTPRequestHandler):
             print(f"🔑 Content-Type: {self.headers.get('Content-Type', 'N/A')}")
             print(f"⏱️  Processing request...")
 
-            # Create a Menu handler instance and delegate
-            menu_handler = MenuHandler(self.request, self.client_address, self.server)
-            menu_handler.headers = self.headers
-            menu_handler.rfile = self.rfile
-            menu_handler.wfile = self.wfile
-            menu_handler.do_POST()
+            MenuHandler.do_POST(self)
 
             print(f"✅ Request completed at {datetime.now().strftime('%H:%M:%S')}")
             print(f"{'='*60}\n")
@@ -65,11 +56,7 @@ class LocalDevHandler(SimpleHTTPRequestHandler):
     def do_OPTIONS(self):
         # Handle CORS preflight for API calls
         if self.path.startswith('/api/'):
-            self.send_response(200)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
+            MenuHandler.do_OPTIONS(self)
         else:
             self.send_error(404)
 
@@ -83,9 +70,6 @@ class LocalDevHandler(SimpleHTTPRequestHandler):
             print(f"[{timestamp}] 📄 {self.command} {self.path}")
 
 def main():
-    # Load environment variables
-    load_env()
-
     # Check for API key
     if not os.environ.get('GEMINI_API_KEY'):
         print("⚠️  Warning: GEMINI_API_KEY not found in environment")
@@ -106,7 +90,8 @@ def main():
     print("Press Ctrl+C to stop the server")
     print("="*60 + "\n")
 
-    httpd = HTTPServer(server_address, LocalDevHandler)
+    # Threaded so the frontend's concurrent batch requests are served in parallel, as on Vercel
+    httpd = ThreadingHTTPServer(server_address, LocalDevHandler)
 
     try:
         httpd.serve_forever()
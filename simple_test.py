@@ -9,16 +9,10 @@ import base64
 import requests
 from pathlib import Path
 from datetime import datetime
+from dev_env import load_env
 
 # Load .env
-env_path = Path(__file__).parent / ".env"
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ[key.strip()] = value.strip()
+load_env()
 
 print("\n" + "="*60)
 print("🧪 Direct Gemini API Test with SystemPrompt.txt")
@@ -6,19 +6,13 @@ import os
 import sys
 import base64
 from pathlib import Path
+from dev_env import load_env
 
 # Set unbuffered output
 os.environ['PYTHONUNBUFFERED'] = '1'
 
 # Load .env
-env_path = Path(__file__).parent / ".env"
-if env_path.exists():
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ[key.strip()] = value.strip()
+if load_env():
     print("✓ Loaded .env file\n")
 
 # Import our API handler
@@ -59,6 +53,11 @@ class MockRequest:
         self._position += size
         return result
 
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
 class MockWFile:
     def __init__(self):
         self.data = b''
@@ -92,8 +91,9 @@ from menu import handler as MenuHandler
 payload_json = json.dumps(payload).encode('utf-8')
 mock = MockHandler(payload_json)
 
-# Manually create handler and call do_POST
-h = MenuHandler(None, None, None)
+# Manually create handler and call do_POST - __new__ skips BaseHTTPRequestHandler.__init__,
+# which would try to serve a real socket
+h = object.__new__(MenuHandler)
 h.headers = mock.headers
 h.rfile = mock.rfile
 h.wfile = mock.wfile
@@ -115,7 +115,7 @@ if mock.response_code == 200:
 
     for i, item in enumerate(menu_items[:3], 1):
         print(f"--- Dish {i} ---")
-        print(f"Chinese: {item.get('chinese', 'N/A')}")
+        print(f"Original: {item.get('original_name') or item.get('chinese', 'N/A')}")
         print(f"English: {item.get('english', 'N/A')}")
         print(f"Spice: {item.get('spiciness_level', 'N/A')}")
         print(f"Pork: {item.get('pork_alert', 'N/A')}")